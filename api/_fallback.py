@@ -0,0 +1,17 @@
+# api/_fallback.py
+# 作用：server.py 匯入失敗時使用的最小 Flask app；只在失敗路徑才會被匯入
+# （檔名以底線開頭，Vercel 不會把它當成獨立的 function）
+
+import orjson
+from flask import Flask, Response
+
+
+def build_fallback_app(import_error):
+    app = Flask(__name__)
+
+    @app.get("/api/ping")
+    def _fallback_ping():
+        body = orjson.dumps({"ok": True, "warning": "fallback app is running", "import_error": str(import_error)})
+        return Response(body, status=200, mimetype="application/json")
+
+    return app
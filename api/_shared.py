@@ -0,0 +1,78 @@
+# api/_shared.py
+# 作用：api/ 底下各 handler 共用的連線池與回應工具；同一個 process 內只建立一次
+# （檔名以底線開頭，Vercel 不會把它當成獨立的 function）
+
+import os, threading
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
+
+# 冷啟動時讀取一次 DATABASE_URL 並預先組好 conninfo，避免每次請求重新查環境變數與解析 DSN
+_DSN = os.environ.get("DATABASE_URL")
+
+# 如果你懷疑舊驅動不支援 channel_binding，可臨時用下一行替換測試
+# _DSN = _DSN.replace("channel_binding=require", "channel_binding=disable")
+
+_CONNINFO = make_conninfo(_DSN, connect_timeout=5) if _DSN else None
+
+# 健康檢查可選擇打到唯讀副本，減少主庫負載；未設定時沿用主庫連線池
+_REPLICA_DSN = os.environ.get("DATABASE_REPLICA_URL")
+_REPLICA_CONNINFO = make_conninfo(_REPLICA_DSN, connect_timeout=5) if _REPLICA_DSN else None
+
+# 模組層級連線池：warm instance 內重用連線，避免每次請求都重新做 TCP/TLS/認證握手
+# 探測與 DDL 都不需要交易，連線一律 autocommit
+_pool = None
+_probe_pool = None
+_pool_lock = threading.Lock()
+
+
+def _make_pool(conninfo):
+    return ConnectionPool(
+        conninfo,
+        min_size=1,
+        max_size=4,
+        timeout=5,
+        kwargs={"autocommit": True, "row_factory": dict_row},
+        open=True,
+    )
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if not _CONNINFO:
+                    raise RuntimeError("Missing env DATABASE_URL")
+                _pool = _make_pool(_CONNINFO)
+    return _pool
+
+
+def get_probe_pool():
+    global _probe_pool
+    if _REPLICA_CONNINFO is None:
+        return get_pool()
+    if _probe_pool is None:
+        with _pool_lock:
+            if _probe_pool is None:
+                _probe_pool = _make_pool(_REPLICA_CONNINFO)
+    return _probe_pool
+
+
+# JSON 回應共用的標頭
+JSON_HEADERS = (("Content-Type", "application/json"), ("Access-Control-Allow-Origin", "*"))
+ERR_TMPL = b'{"ok":false,"error":%b}'
+
+
+def write_response(handler, code, body, headers=JSON_HEADERS):
+    # send_response 會補上 Date/Server 標頭並記錄存取紀錄，標頭都先寫進 _headers_buffer
+    handler.send_response(code)
+    for name, value in headers:
+        handler.send_header(name, value)
+    # 204 不得帶 Content-Length；其餘回應帶上長度，HTTP/1.1 用戶端可重用連線做連續探測
+    if code != 204:
+        handler.send_header("Content-Length", str(len(body)))
+    handler.send_header("Connection", "close" if handler.close_connection else "keep-alive")
+    # 不呼叫 end_headers（會先單獨送出標頭），把空行與 body 一併放進緩衝區，以單次 wfile.write 送出
+    handler._headers_buffer.append(b"\r\n" + body)
+    handler.flush_headers()
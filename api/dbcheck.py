@@ -1,32 +1,40 @@
 from http.server import BaseHTTPRequestHandler
-import os, json, traceback
-import psycopg
-from psycopg.rows import dict_row
+import logging
+import orjson
+
+from api._shared import ERR_TMPL, get_probe_pool, write_response
+
+logger = logging.getLogger(__name__)
+
+# 探測查詢固定不變，搭配連線池在每條連線上準備一次，之後跳過 parse/plan
+_PROBE_SQL = "select now() as ts, current_database() as db, version() as pg"
+# version() 在同一個叢集上不會變，首次查詢後快取，之後只探測 now()/current_database()
+_PROBE_SQL_LITE = "select now() as ts, current_database() as db"
+_PG_VERSION = None
+# 限制探測查詢時間，避免卡住的查詢佔住 serverless instance；與探測查詢同一個 pipeline 送出
+_PROBE_TIMEOUT_SQL = "set local statement_timeout = 500"
+
 
 class handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
     def do_GET(self):
+        global _PG_VERSION
         try:
-            dsn = os.environ.get("DATABASE_URL")
-            if not dsn:
-                raise RuntimeError("Missing env DATABASE_URL")
-
-            # 如果你懷疑舊驅動不支援 channel_binding，可臨時用下一行替換測試
-            # dsn = dsn.replace("channel_binding=require", "channel_binding=disable")
-
-            with psycopg.connect(dsn, connect_timeout=5, row_factory=dict_row) as conn:
-                with conn.cursor() as cur:
-                    cur.execute("select now() as ts, current_database() as db, version() as pg")
-                    row = cur.fetchone()
+            with get_probe_pool().connection() as conn:
+                with conn.pipeline(), conn.transaction():
+                    conn.execute(_PROBE_TIMEOUT_SQL)
+                    cur = conn.execute(_PROBE_SQL if _PG_VERSION is None else _PROBE_SQL_LITE, prepare=True)
+                row = cur.fetchone()
+            if _PG_VERSION is None:
+                _PG_VERSION = row["pg"]
+            else:
+                row["pg"] = _PG_VERSION
 
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Access-Control-Allow-Origin", "*")
-            self.end_headers()
-            self.wfile.write(json.dumps({"ok": True, **row}, default=str).encode("utf-8"))
+            # dict_row 回傳的是一般 dict，直接就地加上 ok 欄位即可
+            row["ok"] = True
+            write_response(self, 200, orjson.dumps(row, default=str))
         except Exception as e:
-            traceback.print_exc()
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Access-Control-Allow-Origin", "*")
-            self.end_headers()
-            self.wfile.write(json.dumps({"ok": False, "error": str(e)}).encode("utf-8"))
+            # 預設只記一行錯誤；開 DEBUG 時才格式化完整 traceback
+            logger.error("dbcheck failed: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            write_response(self, 500, ERR_TMPL % orjson.dumps(str(e)))
@@ -5,9 +5,6 @@ try:
     # 假設你原本的 Flask 主程式在 server.py，且有 app = Flask(__name__)
     from server import app  # noqa: F401
 except Exception as e:  # 後備路徑：避免 import 失敗時完全掛掉，方便你排錯
-    from flask import Flask, jsonify
-    app = Flask(__name__)  # type: ignore
-
-    @app.get("/api/ping")
-    def _fallback_ping():
-        return jsonify({"ok": True, "warning": "fallback app is running", "import_error": str(e)}), 200
+    # 後備 app 放在獨立模組，成功路徑不需要載入它
+    from api._fallback import build_fallback_app
+    app = build_fallback_app(e)  # type: ignore
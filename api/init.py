@@ -1,44 +1,62 @@
 from http.server import BaseHTTPRequestHandler
-import os, json, traceback
-import psycopg
-
-SQL = """
-create table if not exists quotes (
-  id bigserial primary key,
-  symbol text not null,
-  price numeric(18,6) not null,
-  ts timestamptz not null default now()
-);
-create index if not exists idx_quotes_symbol_ts on quotes(symbol, ts desc);
-"""
+import logging, threading
+import orjson
+
+from api._shared import ERR_TMPL, get_pool, write_response
+
+# 每個元素為單一語句，以 pipeline 模式一次送出（extended protocol 不接受多語句字串）
+# 預先壓成單行 bytes，psycopg 不必每次再做 str→bytes 編碼
+SQL = (
+    b"create table if not exists quotes (id bigserial primary key, symbol text not null, "
+    b"price numeric(18,6) not null, ts timestamptz not null default now())",
+    b"create index if not exists idx_quotes_symbol_ts on quotes(symbol, ts desc)",
+)
+
+logger = logging.getLogger(__name__)
+
+# DDL 為冪等操作，同一個 container 內只需執行一次；之後的 POST 直接回應
+_SCHEMA_READY = False
+_schema_lock = threading.Lock()
+
+
+def _ensure_schema():
+    """執行建表 DDL；先前已完成時直接返回"""
+    global _SCHEMA_READY
+    with _schema_lock:
+        if _SCHEMA_READY:
+            return
+        with get_pool().connection() as conn:
+            with conn.pipeline():
+                for stmt in SQL:
+                    conn.execute(stmt)
+        _SCHEMA_READY = True
+
+
+# 成功回應內容固定，預先編碼一次
+_OK_BODY = b'{"ok":true,"message":"tables ensured"}'
+_PREFLIGHT_HEADERS = (
+    ("Access-Control-Allow-Origin", "*"),
+    ("Access-Control-Allow-Methods", "POST, OPTIONS"),
+    ("Access-Control-Allow-Headers", "Content-Type, Authorization"),
+)
+
 
 class handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
     def do_POST(self):
+        # keep-alive 下必須讀掉請求 body，否則會被當成下一個請求解析
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
         try:
-            dsn = os.environ.get("DATABASE_URL")
-            if not dsn:
-                raise RuntimeError("Missing env DATABASE_URL")
-
-            with psycopg.connect(dsn, connect_timeout=5, autocommit=True) as conn:
-                with conn.cursor() as cur:
-                    cur.execute(SQL)
-
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Access-Control-Allow-Origin", "*")
-            self.end_headers()
-            self.wfile.write(json.dumps({"ok": True, "message": "tables ensured"}).encode("utf-8"))
+            if not _SCHEMA_READY:
+                _ensure_schema()
+            write_response(self, 200, _OK_BODY)
         except Exception as e:
-            traceback.print_exc()
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Access-Control-Allow-Origin", "*")
-            self.end_headers()
-            self.wfile.write(json.dumps({"ok": False, "error": str(e)}).encode("utf-8"))
+            # 預設只記一行錯誤；開 DEBUG 時才格式化完整 traceback
+            logger.error("init failed: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            write_response(self, 500, ERR_TMPL % orjson.dumps(str(e)))
 
     def do_OPTIONS(self):
-        self.send_response(204)
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
-        self.end_headers()
+        write_response(self, 204, b"", _PREFLIGHT_HEADERS)
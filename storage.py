@@ -1,73 +1,231 @@
-from typing import Iterable, List, Tuple
+from typing import Iterable, Iterator, List, Tuple
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import chain, islice
+import csv
+import io
+import os
+import threading
+
 import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+# Process-wide pool so warm instances reuse connections instead of paying
+# TCP/TLS/auth on every request. Created lazily on first use. One invocation
+# only ever holds a connection or two, and every warm instance keeps its own
+# pool, so keep it small to stay under the server's max_connections.
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = max(1, int(os.environ.get("STORAGE_POOL_MAX_CONN", "2")))
+# Seconds a borrower waits for a free connection; the pool itself raises as soon as it is full
+POOL_TIMEOUT = float(os.environ.get("STORAGE_POOL_TIMEOUT", "30"))
+
+# Rows per INSERT statement; bounds statement size and memory for long histories
+UPSERT_CHUNK_SIZE = 500
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(POOL_MAX_CONN)
+
+# Set once ensure_tables() has succeeded in this process; later calls skip the DDL round-trips
+_tables_ready = False
+_tables_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadedConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                dsn = os.environ.get("DATABASE_URL")
+                if not dsn:
+                    raise RuntimeError("Missing env DATABASE_URL")
+                _pool = ThreadedConnectionPool(POOL_MIN_CONN, POOL_MAX_CONN, dsn=dsn)
+    return _pool
+
+
+@contextmanager
+def _pooled_connection() -> Iterator["psycopg2.extensions.connection"]:
+    """Borrow a connection from the pool, waiting up to POOL_TIMEOUT for one to free up;
+    roll back anything left uncommitted and return it."""
+    if not _pool_slots.acquire(timeout=POOL_TIMEOUT):
+        raise PoolError(f"no database connection free after {POOL_TIMEOUT:g}s")
+    try:
+        pool = _get_pool()
+        conn = pool.getconn()
+        try:
+            yield conn
+        finally:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            # Drop connections the server has closed instead of handing them out again
+            pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        _pool_slots.release()
+
 
-from .db import get_connection
+UPSERT_PRICES_SQL = """
+    INSERT INTO stock_prices(symbol, trade_date, open, high, low, close, volume)
+    VALUES %s
+    ON CONFLICT (symbol, trade_date) DO UPDATE SET
+      open = EXCLUDED.open,
+      high = EXCLUDED.high,
+      low = EXCLUDED.low,
+      close = EXCLUDED.close,
+      volume = EXCLUDED.volume
+    WHERE (stock_prices.open, stock_prices.high, stock_prices.low, stock_prices.close, stock_prices.volume)
+      IS DISTINCT FROM (EXCLUDED.open, EXCLUDED.high, EXCLUDED.low, EXCLUDED.close, EXCLUDED.volume)
+"""
+
+# Batches of at least one full chunk are loaded with COPY into a staging table
+# and merged with a single set-based INSERT ... SELECT ... ON CONFLICT
+STAGE_PRICES_SQL = """
+    CREATE TEMP TABLE stage_prices (LIKE stock_prices INCLUDING DEFAULTS) ON COMMIT DROP
+"""
+COPY_STAGE_PRICES_SQL = """
+    COPY stage_prices (symbol, trade_date, open, high, low, close, volume) FROM STDIN WITH (FORMAT csv)
+"""
+MERGE_STAGE_PRICES_SQL = """
+    INSERT INTO stock_prices(symbol, trade_date, open, high, low, close, volume)
+    SELECT DISTINCT ON (symbol, trade_date) symbol, trade_date, open, high, low, close, volume
+    FROM stage_prices
+    -- Freshly COPY-loaded rows sit in insertion order, so the highest ctid is the last duplicate sent
+    ORDER BY symbol, trade_date, ctid DESC
+    ON CONFLICT (symbol, trade_date) DO UPDATE SET
+      open = EXCLUDED.open,
+      high = EXCLUDED.high,
+      low = EXCLUDED.low,
+      close = EXCLUDED.close,
+      volume = EXCLUDED.volume
+    WHERE (stock_prices.open, stock_prices.high, stock_prices.low, stock_prices.close, stock_prices.volume)
+      IS DISTINCT FROM (EXCLUDED.open, EXCLUDED.high, EXCLUDED.low, EXCLUDED.close, EXCLUDED.volume)
+"""
+
+
+class _CsvRowStream:
+    """Read-only file-like object that renders rows as CSV on demand for COPY FROM STDIN.
+
+    Rows are pulled from the iterator one chunk at a time, so memory stays bounded
+    no matter how many rows are streamed. None is written as an empty field (NULL).
+    """
+
+    def __init__(self, rows: Iterable[tuple]):
+        self._rows = iter(rows)
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf)
+        self._pending = ""
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._pending) < size:
+            batch = list(islice(self._rows, UPSERT_CHUNK_SIZE))
+            if not batch:
+                break
+            self._writer.writerows(batch)
+            self._pending += self._buf.getvalue()
+            self._buf.seek(0)
+            self._buf.truncate()
+        if size < 0:
+            out, self._pending = self._pending, ""
+        else:
+            out, self._pending = self._pending[:size], self._pending[size:]
+        return out
 
 
 def ensure_tables() -> None:
     """Create minimal tables if not exist.
     - stock_symbols(symbol text primary key, name text, market text)
-    - stock_prices(symbol text, trade_date date, open numeric, high numeric, low numeric, close numeric, volume bigint)
-      primary key (symbol, trade_date)
+    - stock_prices(symbol text, trade_date date, open/high/low/close double precision, volume bigint)
+      primary key (symbol, trade_date), plus an index on trade_date
+    Existing NUMERIC price columns are migrated to DOUBLE PRECISION.
+
+    Runs the DDL only once per process; later calls return immediately.
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS stock_symbols (
-            symbol TEXT PRIMARY KEY,
-            name   TEXT,
-            market TEXT
-        );
-        """
-    )
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS stock_prices (
-            symbol TEXT NOT NULL,
-            trade_date DATE NOT NULL,
-            open NUMERIC,
-            high NUMERIC,
-            low NUMERIC,
-            close NUMERIC,
-            volume BIGINT,
-            PRIMARY KEY(symbol, trade_date)
-        );
-        """
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    global _tables_ready
+    if _tables_ready:
+        return
+    with _tables_lock, _pooled_connection() as conn:
+        if _tables_ready:
+            return
+        cur = conn.cursor()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS stock_symbols (
+                symbol TEXT PRIMARY KEY,
+                name   TEXT,
+                market TEXT
+            );
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS stock_prices (
+                symbol TEXT NOT NULL,
+                trade_date DATE NOT NULL,
+                open DOUBLE PRECISION,
+                high DOUBLE PRECISION,
+                low DOUBLE PRECISION,
+                close DOUBLE PRECISION,
+                volume BIGINT,
+                PRIMARY KEY(symbol, trade_date)
+            );
+            """
+        )
+        # MIN/MAX(trade_date) and date-range filters across all symbols become index lookups
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_stock_prices_trade_date ON stock_prices (trade_date)")
+        # Tables created before the switch still have NUMERIC price columns; convert them in one ALTER
+        cur.execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'stock_prices'
+              AND column_name IN ('open', 'high', 'low', 'close') AND data_type = 'numeric'
+            """
+        )
+        numeric_columns = [r[0] for r in cur.fetchall()]
+        if numeric_columns:
+            cur.execute(
+                sql.SQL("ALTER TABLE stock_prices {}").format(
+                    sql.SQL(", ").join(
+                        sql.SQL("ALTER COLUMN {0} TYPE DOUBLE PRECISION USING {0}::double precision").format(sql.Identifier(c))
+                        for c in numeric_columns
+                    )
+                )
+            )
+        conn.commit()
+        cur.close()
+        _tables_ready = True
 
 
 def upsert_prices(rows: Iterable[Tuple[str, datetime, float, float, float, float, int]]) -> int:
-    """Upsert price rows. Returns number of rows processed.
+    """Upsert price rows. Returns number of rows inserted or changed; identical re-downloads are skipped.
 
     rows: iterable of (symbol, trade_date, open, high, low, close, volume)
     """
-    rows_list: List[Tuple[str, datetime, float, float, float, float, int]] = list(rows)
-    if not rows_list:
+    it = iter(rows)
+    chunk: List[Tuple[str, datetime, float, float, float, float, int]] = list(islice(it, UPSERT_CHUNK_SIZE))
+    if not chunk:
         return 0
 
-    conn = get_connection()
-    cur = conn.cursor()
-    args_str = ",".join(cur.mogrify("(%s,%s,%s,%s,%s,%s,%s)", r).decode("utf-8") for r in rows_list)
-    # Use ON CONFLICT for upsert
-    cur.execute(
-        f"""
-        INSERT INTO stock_prices(symbol, trade_date, open, high, low, close, volume)
-        VALUES {args_str}
-        ON CONFLICT (symbol, trade_date) DO UPDATE SET
-          open = EXCLUDED.open,
-          high = EXCLUDED.high,
-          low = EXCLUDED.low,
-          close = EXCLUDED.close,
-          volume = EXCLUDED.volume
-        """
-    )
-    affected = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
-    return affected
+    with _pooled_connection() as conn:
+        cur = conn.cursor()
+        if len(chunk) < UPSERT_CHUNK_SIZE:
+            # ON CONFLICT cannot touch the same row twice in one statement; keep the last row per key
+            chunk = list({(r[0], r[1]): r for r in chunk}.values())
+            # Small batch: use ON CONFLICT for upsert; execute_values expands VALUES %s into one multi-row statement.
+            # A single statement is atomic on its own, so autocommit skips the BEGIN/COMMIT round-trips.
+            conn.autocommit = True
+            try:
+                execute_values(cur, UPSERT_PRICES_SQL, chunk, page_size=UPSERT_CHUNK_SIZE)
+            finally:
+                conn.autocommit = False
+        else:
+            # Large batch: stream everything through COPY, then merge once
+            cur.execute(STAGE_PRICES_SQL)
+            cur.copy_expert(COPY_STAGE_PRICES_SQL, _CsvRowStream(chain(chunk, it)))
+            cur.execute(MERGE_STAGE_PRICES_SQL)
+            conn.commit()
+        affected = cur.rowcount
+        cur.close()
+        return affected
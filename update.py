@@ -1,13 +1,69 @@
 from flask import Flask, request, jsonify
-from datetime import datetime
-import math
+import threading
+import time
 
+import numpy as np
+import pandas as pd
 import yfinance as yf
 
 from lib.storage import ensure_tables, upsert_prices
 
 app = Flask(__name__)
 
+# Upper bound on symbols per /batch call; keeps one request inside the function timeout
+MAX_BATCH_SYMBOLS = 50
+
+# Seconds a downloaded yfinance frame is reused for the same request; repeated
+# calls within the window skip the Yahoo round-trip and its rate limit
+DOWNLOAD_CACHE_TTL = 300
+_download_cache = {}
+_download_cache_lock = threading.Lock()
+
+
+def _download(tickers, days, **kwargs):
+    """yf.download with a short in-process TTL cache keyed by (tickers, days, options)."""
+    key = (tickers, days, tuple(sorted(kwargs.items())))
+    now = time.monotonic()
+    with _download_cache_lock:
+        hit = _download_cache.get(key)
+        if hit is not None and now - hit[0] < DOWNLOAD_CACHE_TTL:
+            return hit[1]
+    df = yf.download(tickers, period=f"{days}d", interval="1d", auto_adjust=False, progress=False, **kwargs)
+    if df is not None and not df.empty:
+        with _download_cache_lock:
+            # Drop expired entries so the cache cannot grow without bound on a warm instance
+            for k in [k for k, (ts, _) in _download_cache.items() if now - ts >= DOWNLOAD_CACHE_TTL]:
+                del _download_cache[k]
+            _download_cache[key] = (now, df)
+    return df
+
+
+def _parse_days():
+    """Read and clamp the `days` param (default 30, max 365). Returns None if not an integer."""
+    try:
+        days_str = request.args.get('days') or request.form.get('days') or '30'
+        days = int(days_str)
+        return max(1, min(days, 365))
+    except ValueError:
+        return None
+
+
+def _frame_to_rows(symbol, df):
+    """Convert a single-symbol yfinance frame into (symbol, trade_date, open, high, low, close, volume) rows."""
+    df = df.reset_index()  # ensure Date column present
+    n = len(df)
+    trade_dates = pd.to_datetime(df['Date']).dt.date.tolist()
+    prices = []
+    for col in ('Open', 'High', 'Low', 'Close'):
+        if col in df.columns:
+            # NaN/inf become None for DB with one NumPy mask per column
+            arr = df[col].to_numpy(dtype=np.float64)
+            prices.append(np.where(np.isfinite(arr), arr, None).tolist())
+        else:
+            prices.append([None] * n)
+    volume = df['Volume'].fillna(0).astype('int64').tolist() if 'Volume' in df.columns else [0] * n
+    return list(zip([symbol] * n, trade_dates, *prices, volume))
+
 
 @app.route('/', methods=['POST', 'GET'])
 def update_prices():
@@ -24,56 +80,76 @@ def update_prices():
     if not symbol:
         return jsonify({'success': False, 'message': 'symbol is required, e.g. 2330.TW'}), 400
 
-    try:
-        days_str = request.args.get('days') or request.form.get('days') or '30'
-        days = int(days_str)
-        days = max(1, min(days, 365))
-    except ValueError:
+    days = _parse_days()
+    if days is None:
         return jsonify({'success': False, 'message': 'days must be an integer'}), 400
 
     try:
         ensure_tables()
 
         # Fetch recent daily data with yfinance
-        df = yf.download(symbol, period=f"{days}d", interval="1d", auto_adjust=False, progress=False)
+        df = _download(symbol, days)
         if df is None or df.empty:
             return jsonify({'success': False, 'symbol': symbol, 'rows_written': 0, 'message': 'no data returned'}), 200
 
-        df = df.reset_index()  # ensure Date column present
+        rows = _frame_to_rows(symbol, df)
+        written = upsert_prices(rows)
+        return jsonify({'success': True, 'symbol': symbol, 'days_requested': days, 'rows_written': written})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@app.route('/batch', methods=['POST', 'GET'])
+def update_prices_batch():
+    """Update recent daily prices for several symbols with one yfinance download.
+
+    Query params:
+      - symbols: comma-separated, e.g. 2330.TW,2317.TW (required, max 50)
+      - days: integer, number of recent days to fetch (default: 30, max: 365)
+
+    Example:
+      GET /api/update/batch?symbols=2330.TW,2317.TW&days=30
+    """
+    symbols_str = request.args.get('symbols') or request.form.get('symbols') or ''
+    # De-duplicate while keeping request order
+    symbols = list(dict.fromkeys(s.strip() for s in symbols_str.split(',') if s.strip()))
+    if not symbols:
+        return jsonify({'success': False, 'message': 'symbols is required, e.g. 2330.TW,2317.TW'}), 400
+    if len(symbols) > MAX_BATCH_SYMBOLS:
+        return jsonify({'success': False, 'message': f'at most {MAX_BATCH_SYMBOLS} symbols per request'}), 400
+
+    days = _parse_days()
+    if days is None:
+        return jsonify({'success': False, 'message': 'days must be an integer'}), 400
+
+    try:
+        ensure_tables()
+
+        # yfinance fetches the tickers concurrently (threads=True); group_by='ticker' gives one sub-frame per symbol
+        data = _download(" ".join(symbols), days, group_by='ticker', threads=True)
+
         rows = []
-        for _, r in df.iterrows():
-            # Some rows may have NaN; coerce to None for DB
-            def nz(v):
-                if v is None:
-                    return None
-                try:
-                    if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
-                        return None
-                except Exception:
-                    pass
-                return v
-
-            dt = r['Date']
-            # yfinance returns Timestamp; ensure date
-            if hasattr(dt, 'date'):
-                trade_date = dt.date()
-            else:
-                # try parse
-                trade_date = datetime.fromisoformat(str(dt)).date()
-
-            rows.append(
-                (
-                    symbol,
-                    trade_date,
-                    nz(float(r.get('Open')) if 'Open' in r else None),
-                    nz(float(r.get('High')) if 'High' in r else None),
-                    nz(float(r.get('Low')) if 'Low' in r else None),
-                    nz(float(r.get('Close')) if 'Close' in r else None),
-                    int(r.get('Volume')) if 'Volume' in r and not math.isnan(r.get('Volume')) else 0,
-                )
-            )
+        missing = []
+        grouped = data is not None and isinstance(data.columns, pd.MultiIndex)
+        for symbol in symbols:
+            df = None
+            if grouped and symbol in data.columns.get_level_values(0):
+                df = data[symbol].dropna(how='all')
+            elif data is not None and not grouped and len(symbols) == 1:
+                # Some yfinance versions return flat columns for a single ticker
+                df = data
+            if df is None or df.empty:
+                missing.append(symbol)
+                continue
+            rows.extend(_frame_to_rows(symbol, df))
 
         written = upsert_prices(rows)
-        return jsonify({'success': True, 'symbol': symbol, 'days_requested': days, 'rows_written': written})
+        return jsonify({
+            'success': True,
+            'symbols': symbols,
+            'days_requested': days,
+            'rows_written': written,
+            'missing': missing,
+        })
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500